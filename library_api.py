@@ -1,13 +1,28 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request
+from fastapi.responses import Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from starlette.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Literal
+from pydantic import BaseModel, Field, EmailStr, TypeAdapter, ValidationError
+from typing import Dict, List, Optional, Literal, Set
+from collections import defaultdict
+from dataclasses import dataclass, field
 from datetime import datetime, timezone, timedelta
-from passlib.context import CryptContext
-from jose import JWTError, jwt
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from cachetools import TTLCache
+from jwt.utils import base64url_decode
+import anyio
+import hashlib
+import json
+import jwt
 import logging
+import msgspec
+import os
+import sys
+import tempfile
+import threading
+import time
 import uuid
 
 # -----------------------------
@@ -19,19 +34,44 @@ api_router = APIRouter(prefix="/api")
 # -----------------------------
 # TEMP DATABASE (NO MONGODB)
 # -----------------------------
-USERS_DB = {}
-BOOKS_DB = {}
+USERS_DB = {}  # normalized email -> UserInDB
+BOOKS_DB = {}  # book_id -> BookRow
+USER_LOANS: Dict[str, Set[str]] = defaultdict(set)  # email -> borrowed book_ids
+
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "library.msgpack")
+SNAPSHOT_INTERVAL_SECONDS = 60
+# Serializes saves within this process (interval job vs. shutdown)
+_snapshot_lock = anyio.Lock()
+
+# Serialized GET /books body and its ETag, rebuilt lazily after any BOOKS_DB write
+_books_json_cache: Optional[bytes] = None
+_books_etag: Optional[str] = None
+BOOKS_CACHE_CONTROL = "public, max-age=30"
 
 # -----------------------------
 # SECURITY
 # -----------------------------
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+_hasher = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=1)
 SECRET_KEY = "mysupersecretkey"
 ALGORITHM = "HS256"
+# Precomputed hash of the default admin password ("admin123")
+ADMIN_PWHASH = "$argon2id$v=19$m=65536,t=2,p=1$AEmeJT0ZIwvE2LhkRX0aPg$lu+LSdvWeKaiP/I9xYbp8tZ8EbmFYGgWq4R76ueCacQ"
+# Hash of a discarded random secret with the same parameters, verified for unknown emails
+_DUMMY_PWHASH = "$argon2id$v=19$m=65536,t=2,p=1$1xhd+7UHVHmJBjmLHjr07g$a45hMwCxaUTz4RL2tRcT9LSFXUUUV4UT03FznzjMbr8"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
+LOGIN_MAX_FAILED_ATTEMPTS = 5
 
 security = HTTPBearer()
 
+# Verified tokens -> (User, exp), keyed by SHA-256 of the raw token
+_token_cache = TTLCache(maxsize=10000, ttl=30)
+# Token hashes whose HS256 signature already checked out; claims are re-read on every use
+_verified_signatures = TTLCache(maxsize=10000, ttl=60 * 60)
+_token_cache_lock = threading.Lock()
+
+# Client IP -> failed (or still in-flight) login attempts, forgotten after 60s idle
+_login_attempts = TTLCache(maxsize=10000, ttl=60)
+
 # -----------------------------
 # MODELS
 # -----------------------------
@@ -46,13 +86,16 @@ class User(BaseModel):
     role: Literal["user", "admin"] = "user"
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class UserInDB(User):
+    password: str
+
 class Token(BaseModel):
     access_token: str
     token_type: str
     user: User
 
 class Book(BaseModel):
-    book_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    book_id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     title: str
     author: str
     category: str
@@ -64,38 +107,124 @@ class Book(BaseModel):
     borrowed_at: Optional[datetime] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+# Runtime record stored in BOOKS_DB; Book is only used at the API boundary
+@dataclass(slots=True)
+class BookRow:
+    book_id: str
+    title: str
+    author: str
+    category: str
+    description: Optional[str] = None
+    borrow_policy: Literal["standard", "timed", "daily_return"] = "standard"
+    expiry_hours: Optional[int] = None
+    is_borrowed: bool = False
+    borrowed_by: Optional[str] = None
+    borrowed_at: Optional[datetime] = None
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+# On-disk msgpack image of USERS_DB and BOOKS_DB; decoding type-checks every row
+class UserRow(msgspec.Struct):
+    email: str
+    name: str
+    password: str
+    role: Literal["user", "admin"]
+    created_at: datetime
+
+class LibrarySnapshot(msgspec.Struct):
+    users: List[UserRow]
+    books: List[BookRow]
+
+# Serializes BookRow lists entirely in pydantic-core
+_books_adapter = TypeAdapter(List[BookRow])
+
 # -----------------------------
 # HELPERS
 # -----------------------------
 def verify_password(plain, hashed):
-    return pwd_context.verify(plain, hashed)
+    try:
+        return _hasher.verify(hashed, plain)
+    except (VerificationError, InvalidHashError):
+        return False
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return _hasher.hash(password)
+
+def user_key(email: str) -> str:
+    return sys.intern(email.lower())
+
+async def now_utc() -> datetime:
+    # Resolved once per request; FastAPI caches dependency results
+    return datetime.now(timezone.utc)
 
-def create_access_token(data: dict):
+def create_access_token(data: dict, now: datetime):
     to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    expire = now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM), expire
+
+def token_cache_key(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+def cache_token(key: bytes, user: UserInDB, exp: float):
+    with _token_cache_lock:
+        _token_cache[key] = (user, exp)
+
+def decode_token(token: str, key: bytes) -> dict:
+    with _token_cache_lock:
+        verified = key in _verified_signatures
+    if not verified:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"require": ["exp", "sub"]})
+        with _token_cache_lock:
+            _verified_signatures[key] = True
+        return payload
+
+    # Signature is known good for these exact bytes; only the claims need parsing
+    payload = json.loads(base64url_decode(token.split(".")[1]))
+    if payload["exp"] <= time.time():
+        raise jwt.ExpiredSignatureError("Signature has expired")
+    return payload
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # Weak comparison (RFC 9110 §13.1.2): proxies such as nginx's gzip filter weaken tags
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+def invalidate_books_cache():
+    global _books_json_cache
+    _books_json_cache = None
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ) -> User:
+    token = credentials.credentials
+    key = token_cache_key(token)
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+    if cached is not None and cached[1] > time.time():
+        return cached[0]
+
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token, key)
         email: str = payload.get("sub")
         if email is None:
             raise HTTPException(status_code=401, detail="Invalid token")
-    except JWTError:
+    except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+    # Tokens are minted with the stored (already normalized) email as sub
     user = USERS_DB.get(email)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
 
-    return User(**user)
+    cache_token(key, user, payload["exp"])
+    return user
 
 async def get_admin_user(current_user: User = Depends(get_current_user)):
     if current_user.role != "admin":
@@ -107,73 +236,124 @@ async def get_admin_user(current_user: User = Depends(get_current_user)):
 # -----------------------------
 # 1️⃣ Register
 @api_router.post("/register")
-def register(user: UserCreate):
-    if user.email in USERS_DB:
+async def register(user: UserCreate, now: datetime = Depends(now_utc)):
+    key = user_key(user.email)
+    if key in USERS_DB:
         raise HTTPException(status_code=400, detail="User already exists")
 
-    USERS_DB[user.email] = {
-        "email": user.email,
-        "name": user.name,
-        "password": get_password_hash(user.password),
-        "role": "user",
-        "created_at": datetime.now(timezone.utc),
-    }
+    record = UserInDB(
+        email=key,
+        name=user.name,
+        password=await anyio.to_thread.run_sync(get_password_hash, user.password),
+        role="user",
+        created_at=now,
+    )
+    # Another registration may have landed while the hash was computed
+    if USERS_DB.setdefault(key, record) is not record:
+        raise HTTPException(status_code=400, detail="User already exists")
     return {"message": "User registered successfully"}
 
 # 2️⃣ Login
 @api_router.post("/login", response_model=Token)
-def login(email: EmailStr, password: str):
-    user = USERS_DB.get(email)
-    if not user or not verify_password(password, user["password"]):
+async def login(
+    request: Request,
+    email: EmailStr,
+    password: str,
+    now: datetime = Depends(now_utc),
+):
+    # Behind a reverse proxy this is the proxy's address, so all clients share one bucket
+    client_ip = request.client.host if request.client else None
+    attempts = _login_attempts.get(client_ip, 0)
+    if attempts >= LOGIN_MAX_FAILED_ATTEMPTS:
+        raise HTTPException(status_code=429, detail="Too many failed login attempts")
+    # Counted before the KDF runs so concurrent attempts cannot slip past the limit
+    _login_attempts[client_ip] = attempts + 1
+
+    user = USERS_DB.get(user_key(email))
+    # Unknown emails verify against a dummy hash so timing does not reveal them
+    hashed = user.password if user else _DUMMY_PWHASH
+    valid = await anyio.to_thread.run_sync(verify_password, password, hashed)
+    if not user or not valid:
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
-    token = create_access_token({"sub": email})
+    # Refund only this attempt; earlier failures from the IP still count
+    attempts = _login_attempts.get(client_ip, 0)
+    if attempts > 1:
+        _login_attempts[client_ip] = attempts - 1
+    else:
+        _login_attempts.pop(client_ip, None)
+
+    token, expire = create_access_token({"sub": user.email}, now)
+    # Warm the cache so the first authenticated request skips jwt.decode
+    cache_token(token_cache_key(token), user, int(expire.timestamp()))
     return {
         "access_token": token,
         "token_type": "bearer",
-        "user": User(**user),
+        "user": User.model_construct(**user.model_dump(exclude={"password"})),
     }
 
 # 3️⃣ Get all books
 @api_router.get("/books", response_model=List[Book])
-def get_books():
-    return list(BOOKS_DB.values())
+async def get_books(request: Request):
+    global _books_json_cache, _books_etag
+    if _books_json_cache is None:
+        _books_json_cache = _books_adapter.dump_json(list(BOOKS_DB.values()))
+        # Content hash, so the tag survives restarts and matches across workers
+        _books_etag = f'"{hashlib.blake2b(_books_json_cache, digest_size=16).hexdigest()}"'
+
+    headers = {"ETag": _books_etag, "Cache-Control": BOOKS_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), _books_etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=_books_json_cache, media_type="application/json", headers=headers)
 
 # 4️⃣ Admin: Add a book
 @api_router.post("/books", response_model=Book)
-def add_book(book: Book, admin: User = Depends(get_admin_user)):
-    BOOKS_DB[book.book_id] = book.dict()
+async def add_book(book: Book, admin: User = Depends(get_admin_user)):
+    BOOKS_DB[book.book_id] = BookRow(**{**book.model_dump(), "category": sys.intern(book.category)})
+    invalidate_books_cache()
     return book
 
 # 5️⃣ Borrow a book
 @api_router.post("/books/borrow/{book_id}")
-def borrow_book(book_id: str, user: User = Depends(get_current_user)):
+async def borrow_book(
+    book_id: str,
+    user: User = Depends(get_current_user),
+    now: datetime = Depends(now_utc),
+):
     book = BOOKS_DB.get(book_id)
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
-    if book["is_borrowed"]:
+    if book.is_borrowed:
         raise HTTPException(status_code=400, detail="Book already borrowed")
 
-    book["is_borrowed"] = True
-    book["borrowed_by"] = user.email
-    book["borrowed_at"] = datetime.now(timezone.utc)
-    BOOKS_DB[book_id] = book
-    return {"message": f"{book['title']} borrowed successfully"}
+    book.is_borrowed = True
+    book.borrowed_by = user.email
+    book.borrowed_at = now
+    USER_LOANS[user.email].add(book_id)
+    invalidate_books_cache()
+    return {"message": f"{book.title} borrowed successfully"}
 
 # 6️⃣ Return a book
 @api_router.post("/books/return/{book_id}")
-def return_book(book_id: str, user: User = Depends(get_current_user)):
+async def return_book(book_id: str, user: User = Depends(get_current_user)):
     book = BOOKS_DB.get(book_id)
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
-    if not book["is_borrowed"] or book["borrowed_by"] != user.email:
+    if not book.is_borrowed or book.borrowed_by != user.email:
         raise HTTPException(status_code=400, detail="You cannot return this book")
 
-    book["is_borrowed"] = False
-    book["borrowed_by"] = None
-    book["borrowed_at"] = None
-    BOOKS_DB[book_id] = book
-    return {"message": f"{book['title']} returned successfully"}
+    book.is_borrowed = False
+    book.borrowed_by = None
+    book.borrowed_at = None
+    USER_LOANS[user.email].discard(book_id)
+    invalidate_books_cache()
+    return {"message": f"{book.title} returned successfully"}
+
+# 7️⃣ My borrowed books
+@api_router.get("/books/mine", response_model=List[Book])
+async def get_my_books(user: User = Depends(get_current_user)):
+    books = [BOOKS_DB[book_id] for book_id in USER_LOANS.get(user.email, ())]
+    return Response(content=_books_adapter.dump_json(books), media_type="application/json")
 
 # -----------------------------
 # ROOT
@@ -184,7 +364,7 @@ class StatusResponse(BaseModel):
     status: str
 
 @app.get("/", response_model=StatusResponse)
-def root():
+async def root():
     return {"status": "Library API running ✅"}
 
 
@@ -198,6 +378,56 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# -----------------------------
+# PERSISTENCE
+# -----------------------------
+def load_snapshot() -> bool:
+    try:
+        with open(SNAPSHOT_PATH, "rb") as f:
+            snapshot = msgspec.msgpack.decode(f.read(), type=LibrarySnapshot)
+        # The file is external input, so users go through full model validation (e.g. EmailStr)
+        users = {
+            user_key(user.email): UserInDB(**msgspec.structs.asdict(user))
+            for user in snapshot.users
+        }
+    except FileNotFoundError:
+        return False
+    except (msgspec.DecodeError, ValidationError) as e:
+        # Truncated, corrupt or from an older layout; start fresh rather than fail to boot
+        logger.warning(f"Ignoring unreadable snapshot {SNAPSHOT_PATH}: {e}")
+        return False
+
+    USERS_DB.update(users)
+    BOOKS_DB.update({book.book_id: book for book in snapshot.books})
+    for book in snapshot.books:
+        if book.borrowed_by is not None:
+            USER_LOANS[book.borrowed_by].add(book.book_id)
+    invalidate_books_cache()
+    return True
+
+def write_snapshot(data: bytes):
+    # Write to a unique file beside the snapshot and swap it in, so a crash
+    # never leaves a truncated snapshot and concurrent writers never share a temp file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(SNAPSHOT_PATH) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, SNAPSHOT_PATH)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+async def save_snapshot():
+    # The lock is held until the write thread finishes, even if this task is
+    # cancelled, so the shutdown save always lands after any in-flight one
+    async with _snapshot_lock:
+        # Encode on the event loop so the tables cannot change mid-snapshot
+        data = msgspec.msgpack.encode(LibrarySnapshot(
+            users=[UserRow(**user.model_dump()) for user in USERS_DB.values()],
+            books=list(BOOKS_DB.values()),
+        ))
+        await anyio.to_thread.run_sync(write_snapshot, data)
+
 # -----------------------------
 # STARTUP
 # -----------------------------
@@ -206,15 +436,21 @@ logger = logging.getLogger(__name__)
 scheduler = AsyncIOScheduler()
 @app.on_event("startup")
 async def startup_event():
+    if load_snapshot():
+        logger.info(f"Loaded {len(USERS_DB)} users and {len(BOOKS_DB)} books from {SNAPSHOT_PATH}")
+
+    now = datetime.now(timezone.utc)
+
     # Create admin if not exists
-    if "admin@library.com" not in USERS_DB:
-        USERS_DB["admin@library.com"] = {
-            "email": "admin@library.com",
-            "name": "Admin",
-            "password": get_password_hash("admin123"),
-            "role": "admin",
-            "created_at": datetime.now(timezone.utc),
-        }
+    admin_key = user_key("admin@library.com")
+    if admin_key not in USERS_DB:
+        USERS_DB[admin_key] = UserInDB(
+            email=admin_key,
+            name="Admin",
+            password=ADMIN_PWHASH,
+            role="admin",
+            created_at=now,
+        )
         logger.info("Admin created: admin@library.com / admin123")
 
     # Preload sample books
@@ -263,10 +499,23 @@ async def startup_event():
         },
     ]
 
-    for book in sample_books:
-        BOOKS_DB[book["book_id"]] = {**book, "is_borrowed": False, "borrowed_by": None, "borrowed_at": None, "created_at": datetime.now(timezone.utc)}
+    if not BOOKS_DB:
+        BOOKS_DB.update({
+            book["book_id"]: BookRow(**{**book, "category": sys.intern(book["category"])}, created_at=now)
+            for book in sample_books
+        })
+        invalidate_books_cache()
 
-    logger.info(f"{len(sample_books)} sample books added to BOOKS_DB")
+        logger.info(f"{len(sample_books)} sample books added to BOOKS_DB")
 
+    scheduler.add_job(save_snapshot, "interval", seconds=SNAPSHOT_INTERVAL_SECONDS, max_instances=1)
     scheduler.start()
     logger.info("Scheduler started")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    scheduler.shutdown()
+    await save_snapshot()
+    logger.info(f"Snapshot written to {SNAPSHOT_PATH}")
+
+app.include_router(api_router)